@@ -1,14 +1,19 @@
 import io
+import os
 import re
 import html
+import json
+import pathlib
 import zipfile
+import urllib.request
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-import requests
-import pandas as pd
+import numpy as np
 import streamlit as st
 
-from docx import Document
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+# pandas and python-docx are imported lazily: pandas only once an Excel
+# file is uploaded, python-docx only when the skeleton is first built.
 
 
 # ================== Core Logic (Shared) ================== #
@@ -20,34 +25,56 @@ ALEPH_BET = [
 ]
 
 letter_to_index = {letter: i for i, letter in enumerate(ALEPH_BET)}
-TAG_RE = re.compile(r"<[^>]+>")
+
+# HTML tags and parsha markers ({פ}/{ס}) stripped in a single pass.
+CLEAN_RE = re.compile(r"<[^>]+>|\{[פס]\}")
+
+# Code-point-indexed lookup table mapping Hebrew letters (final forms
+# included) to their stanza index; every other character maps to -1.
+_LETTER_LUT = np.full(0x600, -1, dtype=np.int8)
+for _letter, _idx in letter_to_index.items():
+    _LETTER_LUT[ord(_letter)] = _idx
+for _final, _regular in {"ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ"}.items():
+    _LETTER_LUT[ord(_final)] = letter_to_index[_regular]
 
 
 def clean_hebrew_verse(raw: str) -> str:
     """Remove HTML tags, entities, and parsha markers from a verse."""
-    text = html.unescape(raw)
-    text = TAG_RE.sub("", text)
-    text = text.replace("{פ}", "").replace("{ס}", "")
-    return text.strip()
+    return CLEAN_RE.sub("", html.unescape(raw)).strip()
+
+
+TEHILLIM_PATH = pathlib.Path(__file__).parent / "data" / "tehillim119.json"
 
 
 @st.cache_data
 def load_tehillim_119():
     """
-    Fetch Tehillim 119 (Hebrew) from Sefaria, clean it,
-    and return a list of 176 verses.
-    Cached so it only runs once.
+    Load Tehillim 119 (Hebrew) as a list of 176 verses.
+
+    Reads the bundled data file when present, so sessions normally never
+    touch the network. Falls back to fetching from Sefaria (and persists
+    the cleaned result for next time) only if the file is missing.
     """
+    if TEHILLIM_PATH.exists():
+        return json.loads(TEHILLIM_PATH.read_text(encoding="utf-8"))
+
     url = "https://www.sefaria.org/api/texts/Psalms.119?lang=he&context=0"
-    resp = requests.get(url)
-    resp.raise_for_status()
-    data = resp.json()
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        data = json.loads(resp.read())
     verses = data["he"]
     cleaned = [clean_hebrew_verse(v) for v in verses]
 
     if len(cleaned) != 176:
         raise ValueError(f"Expected 176 verses, got {len(cleaned)}")
 
+    try:
+        TEHILLIM_PATH.parent.mkdir(parents=True, exist_ok=True)
+        TEHILLIM_PATH.write_text(
+            json.dumps(cleaned, ensure_ascii=False), encoding="utf-8"
+        )
+    except OSError:
+        # Best effort: a read-only app directory shouldn't break startup.
+        pass
     return cleaned
 
 
@@ -58,55 +85,128 @@ def build_stanzas(verses_119):
 
 def get_stanzas_for_name(name, stanzas):
     """Return list of (letter, stanza) pairs for a Hebrew name."""
-    sections = []
+    codes = np.frombuffer(name.encode("utf-32-le"), dtype=np.uint32)
+    codes = codes[codes < _LETTER_LUT.size]
+    idxs = _LETTER_LUT[codes]
+    idxs = idxs[idxs >= 0]
+    return [(ALEPH_BET[i], stanzas[i]) for i in idxs]
+
+
+TITLE_PREFIX = "תהילים פרק קיט עבור השם: "
+
+P_XML_TMPL = (
+    '<w:p><w:pPr><w:pStyle w:val="RTLRight"/></w:pPr>'
+    '<w:r><w:t xml:space="preserve">%s</w:t></w:r></w:p>'
+)
+BLANK_P_XML = P_XML_TMPL % ""
+
 
-    final_to_regular = {
-        "ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ"
-    }
+def paragraph_xml(text):
+    """Serialize one paragraph in the skeleton's RTL style as WordprocessingML."""
+    return P_XML_TMPL % html.escape(text)
 
-    name = name.strip()
 
-    for ch in name:
-        if ch == " ":
-            continue
+@st.cache_resource
+def _skeleton():
+    """
+    Build an empty DOCX once and return (parts, body_head, body_tail),
+    where parts are all zip members except word/document.xml, and the
+    head/tail are document.xml split at the (empty) body so generated
+    paragraphs can be spliced in between.
+
+    The skeleton carries an "RTLRight" paragraph style so generated
+    paragraphs only need a style reference instead of inline pPr
+    formatting.
+    """
+    from docx import Document
+    from docx.enum.style import WD_STYLE_TYPE
+    from docx.oxml import OxmlElement
 
-        letter = final_to_regular.get(ch, ch)
-        idx = letter_to_index.get(letter)
+    doc = Document()
+    style = doc.styles.add_style("RTLRight", WD_STYLE_TYPE.PARAGRAPH)
+    # w:bidi must come first in the pPr sequence. No explicit w:jc: an
+    # RTL paragraph already starts at the right margin, and with bidi
+    # set the left/right jc values swap meaning.
+    style.element.get_or_add_pPr().insert(0, OxmlElement("w:bidi"))
 
-        if idx is not None:
-            sections.append((letter, stanzas[idx]))
-    return sections
+    bio = io.BytesIO()
+    doc.save(bio)
+
+    parts = []
+    document_xml = None
+    with zipfile.ZipFile(bio) as zf:
+        for part_name in zf.namelist():
+            data = zf.read(part_name)
+            if part_name == "word/document.xml":
+                document_xml = data.decode("utf-8")
+            else:
+                parts.append((part_name, data))
+
+    head, tail = document_xml.split("<w:body>", 1)
+    # tail keeps the default sectPr and the closing tags.
+    return parts, head + "<w:body>", tail
+
+
+@st.cache_resource
+def stanza_xml_fragments(stanzas):
+    """
+    Serialize each stanza's pesukim to XML exactly once per session;
+    document assembly then just concatenates the precomputed fragments.
+    """
+    return ["".join(paragraph_xml(p) for p in stanza) for stanza in stanzas]
 
 
 def build_docx_bytes_for_name(name, stanzas):
     """
     Build a DOCX in memory for a given name and return bytes.
+
+    The body is emitted directly as WordprocessingML strings spliced into
+    an empty skeleton document, which avoids one python-docx element
+    construction (and style lookup) per paragraph on the hot path.
     """
     sections = get_stanzas_for_name(name, stanzas)
     if not sections:
         raise ValueError(f"No valid Hebrew letters found in name '{name}'.")
 
-    doc = Document()
+    fragments = stanza_xml_fragments(stanzas)
 
-    title_para = doc.add_paragraph(f"תהילים פרק קיט עבור השם: {name}")
-    title_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    body = [
+        paragraph_xml(TITLE_PREFIX + name),
+        BLANK_P_XML,
+    ]
+    for letter, _stanza in sections:
+        body.append(paragraph_xml(letter))
+        body.append(fragments[letter_to_index[letter]])
+        body.append(BLANK_P_XML)
 
-    doc.add_paragraph("").alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    parts, body_head, body_tail = _skeleton()
+    document_xml = body_head + "".join(body) + body_tail
 
-    for letter, stanza in sections:
-        p_letter = doc.add_paragraph(letter)
-        p_letter.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    bio = io.BytesIO()
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as zf:
+        for part_name, data in parts:
+            zf.writestr(part_name, data)
+        zf.writestr("word/document.xml", document_xml)
+    return bio.getvalue()
 
-        for pasuk in stanza:
-            p = doc.add_paragraph(pasuk)
-            p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
 
-        doc.add_paragraph("").alignment = WD_ALIGN_PARAGRAPH.RIGHT
+def _build_one(args):
+    """Build one DOCX in a worker; returns (name, bytes) or (name, None) on failure."""
+    name, stanzas = args
+    try:
+        return name, build_docx_bytes_for_name(name, stanzas)
+    except Exception:
+        return name, None
 
-    bio = io.BytesIO()
-    doc.save(bio)
-    bio.seek(0)
-    return bio.getvalue()
+
+def _batch_executor():
+    """
+    Document building is CPU-bound, so use a process pool when fork is
+    available; fall back to threads where it is not (e.g. Streamlit Cloud).
+    """
+    if multiprocessing.get_start_method() == "fork":
+        return ProcessPoolExecutor(max_workers=os.cpu_count())
+    return ThreadPoolExecutor(max_workers=os.cpu_count())
 
 
 # ================== Streamlit UI ================== #
@@ -125,6 +225,15 @@ with st.spinner("Loading Tehillim 119 text..."):
     verses_119 = load_tehillim_119()
     stanzas_119 = build_stanzas(verses_119)
 
+
+@st.cache_data(max_entries=4096)
+def _docx_cached(name):
+    """
+    Memoize built documents per name across reruns; the stanza text is
+    constant for a deployment, so repeat requests for a name are free.
+    """
+    return build_docx_bytes_for_name(name, stanzas_119)
+
 st.divider()
 
 tab_single, tab_excel = st.tabs(["🔹 Single Name", "📄 Excel – Multiple Names"])
@@ -141,7 +250,7 @@ with tab_single:
             st.error("Please enter a Hebrew name.")
         else:
             try:
-                docx_bytes = build_docx_bytes_for_name(single_name, stanzas_119)
+                docx_bytes = _docx_cached(single_name)
                 safe_name = single_name.strip().replace(" ", "_") or "name"
                 filename = f"{safe_name}_Tehillim119.docx"
 
@@ -171,48 +280,67 @@ with tab_excel:
     )
 
     if uploaded_file is not None:
+        import pandas as pd
+
+        # Parse only the Name column as strings; loading every column and
+        # inferring dtypes dominates latency for wide spreadsheets.
+        engine = "xlrd" if uploaded_file.name.lower().endswith(".xls") else "openpyxl"
         try:
-            df = pd.read_excel(uploaded_file)
+            df = pd.read_excel(uploaded_file, usecols=["Name"], dtype=str, engine=engine)
+        except ValueError as e:
+            # usecols raises ValueError when the column is absent; other
+            # ValueErrors are ordinary parse failures.
+            if "Usecols do not match" in str(e):
+                st.error("The Excel file must contain a column named 'Name'.")
+            else:
+                st.error(f"Could not read Excel file: {e}")
+            df = None
         except Exception as e:
             st.error(f"Could not read Excel file: {e}")
             df = None
 
         if df is not None:
-            if "Name" not in df.columns:
-                st.error("The Excel file must contain a column named 'Name'.")
-            else:
-                st.write("Preview of names:")
-                st.dataframe(df[["Name"]].head())
-
-                if st.button("Generate DOCX Files for All Names"):
-                    names = [str(n).strip() for n in df["Name"].dropna()]
-                    names = [n for n in names if n]
-
-                    if not names:
-                        st.error("No valid names found in the 'Name' column.")
-                    else:
-                        zip_buffer = io.BytesIO()
-                        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-                            for name in names:
-                                try:
-                                    docx_bytes = build_docx_bytes_for_name(name, stanzas_119)
-                                    safe_name = name.replace(" ", "_") or "name"
-                                    file_name = f"{safe_name}_Tehillim119.docx"
-                                    zf.writestr(file_name, docx_bytes)
-                                except Exception:
-                                    # You could also log errors per-name here
-                                    continue
-                        zip_buffer.seek(0)
-
-                        st.success(
-                            f"Generated documents for {len(names)} name(s). "
-                            "Download them as a ZIP file below."
-                        )
-                        st.download_button(
-                            label="⬇ Download ZIP of DOCX files",
-                            data=zip_buffer.getvalue(),
-                            file_name="Tehillim119_Names.zip",
-                            mime="application/zip",
-                        )
+            st.write("Preview of names:")
+            st.dataframe(df[["Name"]].head())
+
+            if st.button("Generate DOCX Files for All Names"):
+                names = df["Name"].dropna().str.strip()
+                names = names[names != ""].tolist()
+
+                if not names:
+                    st.error("No valid names found in the 'Name' column.")
+                else:
+                    zip_buffer = io.BytesIO()
+                    # Duplicate names produce identical documents (and
+                    # identical filenames), so build each one only once.
+                    unique_names = list(dict.fromkeys(names))
+                    args = [(name, stanzas_119) for name in unique_names]
+                    # DOCX payloads are already deflate-compressed, so
+                    # store them as-is instead of re-compressing.
+                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zf, \
+                            _batch_executor() as ex:
+                        # Build documents in parallel (one per core) but keep
+                        # the single ZIP writer here in the parent.
+                        for name, docx_bytes in ex.map(_build_one, args, chunksize=8):
+                            if docx_bytes is None:
+                                # You could also log errors per-name here
+                                continue
+                            safe_name = name.replace(" ", "_") or "name"
+                            file_name = f"{safe_name}_Tehillim119.docx"
+                            zf.writestr(file_name, docx_bytes)
+                    zip_buffer.seek(0)
+
+                    st.success(
+                        f"Generated documents for {len(names)} name(s). "
+                        "Download them as a ZIP file below."
+                    )
+                    st.download_button(
+                        label="⬇ Download ZIP of DOCX files",
+                        # Pass the buffer itself; .getvalue() would copy
+                        # the whole archive a second time.
+                        data=zip_buffer,
+                        file_name="Tehillim119_Names.zip",
+                        mime="application/zip",
+                    )
     else:
         st.info("Upload an Excel file to enable batch generation.")